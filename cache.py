@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """TTL-кеш ответов OpenDota с объединением одинаковых запросов.
+    Просроченные записи еще stale_ttl секунд отдаются, если OpenDota не ответил"""
+
+    def __init__(self, ttl=300, max_size=5000, stale_ttl=86400, revalidate_wait=2):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.revalidate_wait = revalidate_wait
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def is_stale(self, key):
+        """Запись есть, но просрочена - значит, последний раз отдали старые данные"""
+        item = self._data.get(key)
+        return item is not None and item[0] < time.monotonic()
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch, ttl=None):
+        """Возвращает значение из кеша или загружает его один раз на всех"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t, ttl))
+
+        stale = None
+        item = self._data.get(key)
+        if item is not None:
+            if time.monotonic() - item[0] <= self.stale_ttl:
+                stale = item[1]
+            else:
+                del self._data[key]
+
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        if stale is None:
+            return await asyncio.shield(task)
+
+        # Есть старые данные: ждем обновления недолго, иначе отдаем их,
+        # а загрузка продолжится в фоне
+        try:
+            value = await asyncio.wait_for(asyncio.shield(task), self.revalidate_wait)
+        except Exception:
+            value = None
+        if value:
+            return value
+        self.stale_served += 1
+        return stale
+
+    def _on_fetched(self, key, task, ttl):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        # None и пустые ответы (ошибки) не кешируем
+        value = task.result()
+        if value:
+            self.set(key, value, ttl)
+
+    def dump(self):
+        """Живые JSON-записи с оставшимся TTL для снимка на диск"""
+        now = time.monotonic()
+        return [
+            [key, expires_at - now, value]
+            for key, (expires_at, value) in self._data.items()
+            if expires_at > now and isinstance(value, (dict, list))
+        ]
+
+    def load(self, entries, elapsed=0):
+        """Загружает снимок; elapsed - сколько секунд бот был выключен"""
+        loaded = 0
+        for key, ttl_left, value in entries:
+            ttl_left -= elapsed
+            if ttl_left > 0:
+                self.set(key, value, ttl_left)
+                loaded += 1
+        return loaded
+
+
+# Создаем глобальный экземпляр
+api_cache = ResponseCache()
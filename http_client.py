@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_session = None
+
+# ========== CIRCUIT BREAKER ==========
+FAILURE_THRESHOLD = 5  # подряд ошибок/медленных ответов до размыкания
+SLOW_CALL_SECONDS = 5  # ответ дольше - считаем сбоем
+RESET_TIMEOUT = 30  # через сколько секунд пробуем снова
+
+
+class CircuitOpenError(Exception):
+    """Сервис недоступен, запрос не отправляем"""
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= RESET_TIMEOUT:
+            return "half_open"
+        return "open"
+
+    def check(self):
+        """Бросает CircuitOpenError или возвращает True, если это пробный запрос"""
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError(f"{self.name} недоступен, повтор через {RESET_TIMEOUT} с")
+        if state == "half_open":
+            # Пропускаем один пробный запрос, остальные отбиваем сразу
+            if self._trial:
+                raise CircuitOpenError(f"{self.name}: идет пробный запрос")
+            self._trial = True
+            return True
+        return False
+
+    def release_trial(self):
+        self._trial = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"✅ {self.name} снова отвечает, breaker замкнут")
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or (self.opened_at is None and self.failures >= FAILURE_THRESHOLD):
+            logger.warning(f"⚠️ {self.name}: {self.failures} сбоев подряд, breaker разомкнут")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+
+_breakers = {}
+
+
+def get_breaker(url):
+    host = urlsplit(url).hostname
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+def get_session():
+    """Общий aiohttp-пул соединений вместо новой сессии на каждый запрос"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+        )
+    return _session
+
+
+@asynccontextmanager
+async def request(url, timeout=10):
+    """GET через общий пул и circuit breaker хоста.
+    Ошибки сети, 5xx, 429 и медленные ответы считаются сбоями"""
+    breaker = get_breaker(url)
+    is_trial = breaker.check()
+
+    recorded = False
+    start = time.monotonic()
+    try:
+        async with get_session().get(url, timeout=timeout) as r:
+            if r.status >= 500 or r.status == 429 or time.monotonic() - start > SLOW_CALL_SECONDS:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            recorded = True
+            yield r
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        if not recorded:
+            breaker.record_failure()
+        raise
+    except BaseException:
+        # Отмена (например, таймаут inline-запроса) - не вина сервиса,
+        # но если это был пробный запрос, его надо освободить
+        if is_trial and not recorded:
+            breaker.release_trial()
+        raise
+
+
+async def warm_up():
+    """Заранее открывает соединение с OpenDota (DNS + TLS), чтобы первый запрос был быстрым"""
+    try:
+        async with get_session().head("https://api.opendota.com/api/", timeout=5):
+            pass
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть соединение с OpenDota: {e}")
+
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -2,11 +2,22 @@ from flask import Flask, jsonify
 from threading import Thread
 import os
 import logging
+import datetime
+import socket
+import startup
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# psutil грузим здесь (в фоновом потоке keep-alive), а не на первом /status
+try:
+    import psutil
+    psutil.cpu_percent(interval=None)
+except ImportError:
+    psutil = None
+    logger.warning("psutil не установлен, /status без системных метрик")
+
 app = Flask(__name__)
 
 @app.route('/')
@@ -147,30 +158,36 @@ def health():
     return jsonify({
         "status": "healthy",
         "service": "dota2-telegram-bot",
-        "timestamp": "online"
+        "timestamp": "online",
+        "ready": startup.ready.is_set()
     }), 200
 
+@app.route('/ready')
+def ready():
+    """Готовность: 200 только когда бот прогрет (БД, константы, HTTP-пул)"""
+    if startup.ready.is_set():
+        return jsonify({"status": "ready", "uptime": round(startup.uptime(), 1)}), 200
+    return jsonify({"status": "starting"}), 503
+
 @app.route('/status')
 def status():
     """Статус сервера"""
-    import datetime
-    import psutil
-    import socket
-    
-    # Получаем информацию о системе
-    memory = psutil.virtual_memory()
-    cpu_percent = psutil.cpu_percent(interval=1)
+    system = {}
+    if psutil:
+        # interval=None не блокирует запрос на секунду: считаем от прошлого вызова
+        memory = psutil.virtual_memory()
+        system = {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_available_gb": round(memory.available / (1024**3), 2)
+        }
     
     return jsonify({
         "status": "running",
         "service": "Dota2 Telegram Bot",
         "timestamp": datetime.datetime.now().isoformat(),
         "hostname": socket.gethostname(),
-        "system": {
-            "cpu_percent": cpu_percent,
-            "memory_percent": memory.percent,
-            "memory_available_gb": round(memory.available / (1024**3), 2)
-        },
+        "system": system,
         "environment": {
             "python_version": "3.11.x",
             "platform": "Railway"
@@ -178,4 +195,18 @@ def status():
     }), 200
 
 @app.route('/ping')
-def ping():
\ No newline at end of file
+def ping():
+    return "pong", 200
+
+def run():
+    port = int(os.environ.get('PORT', 8080))
+    app.run(host='0.0.0.0', port=port)
+
+def keep_alive():
+    """Запускает Flask в фоновом потоке"""
+    Thread(target=run, daemon=True).start()
+
+if __name__ == '__main__':
+    # Отдельный web-процесс: бота здесь нет, прогревать нечего
+    startup.ready.set()
+    run()
@@ -0,0 +1,85 @@
+import os
+import gzip
+import json
+import asyncio
+import logging
+
+from aiogram import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+# На Railway положите снимок на volume, иначе он не переживет редеплой
+CACHE_SNAPSHOT = os.getenv('CACHE_SNAPSHOT', 'cache_snapshot.json.gz')
+
+
+class Lifecycle:
+    """Учет апдейтов в обработке и корректная остановка бота"""
+
+    def __init__(self):
+        self.accepting = True
+        self._inflight = set()
+        self._tasks = []
+
+    def middleware(self):
+        lifecycle = self
+
+        class InflightMiddleware(BaseMiddleware):
+            async def __call__(self, handler, event, data):
+                if not lifecycle.accepting:
+                    # Бот останавливается: новые апдейты не берем
+                    return None
+                task = asyncio.current_task()
+                lifecycle._inflight.add(task)
+                try:
+                    return await handler(event, data)
+                finally:
+                    lifecycle._inflight.discard(task)
+
+        return InflightMiddleware()
+
+    def create_task(self, coro):
+        """Фоновая задача, которую нужно отменить при остановке"""
+        task = asyncio.create_task(coro)
+        self._tasks.append(task)
+        return task
+
+    async def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        self.accepting = False
+        pending = {t for t in self._inflight if t is not asyncio.current_task()}
+        if not pending:
+            return
+        logger.info(f"⏳ Ждем завершения {len(pending)} апдейтов (до {timeout:.0f} с)")
+        _, still_running = await asyncio.wait(pending, timeout=timeout)
+        if still_running:
+            logger.warning(f"⚠️ Не дождались {len(still_running)} апдейтов, отменяем")
+            for task in still_running:
+                task.cancel()
+
+    async def cancel_tasks(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+def save_snapshot(data, path=CACHE_SNAPSHOT):
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=CACHE_SNAPSHOT):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Снимок кеша поврежден, пропускаем: {e}")
+        return {}
+
+
+# Создаем глобальный экземпляр
+lifecycle = Lifecycle()
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# Доля логов "апдейт обработан", которые пишем (ошибки и медленные - всегда)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+SLOW_UPDATE_MS = 1000
+
+# Шумные логгеры, которые пишут строку на каждый апдейт
+NOISY_LOGGERS = {'aiogram.event'}
+
+# Контекст текущего апдейта: update_id, user_id, handler
+log_context = ContextVar('log_context', default=None)
+
+CONTEXT_FIELDS = ('update_id', 'user_id', 'handler', 'latency_ms')
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи поля текущего апдейта (работает в потоке хендлера)"""
+
+    def filter(self, record):
+        context = log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только часть шумных INFO-логов"""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if record.name in NOISY_LOGGERS or getattr(record, 'sample', False):
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Форматируем сообщение и traceback в потоке хендлера,
+        # но оставляем поля записи для JsonFormatter
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Логи уходят в очередь, диск пишет отдельный поток QueueListener"""
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    # Дописываем хвост очереди при выходе
+    atexit.register(listener.stop)
+    return listener
+
+
+class LoggingMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: контекст для логов и время обработки"""
+
+    def __init__(self):
+        self.logger = logging.getLogger('bot.updates')
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        context = {'update_id': event.update_id, 'user_id': user.id if user else None}
+        token = log_context.set(context)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.logger.info(
+                f"Апдейт {event.event_type} обработан за {latency_ms} мс",
+                extra={'latency_ms': latency_ms, 'sample': latency_ms < SLOW_UPDATE_MS}
+            )
+            log_context.reset(token)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner-middleware: записывает в контекст имя выбранного хендлера"""
+
+    async def __call__(self, handler, event, data):
+        context = log_context.get()
+        handler_object = data.get('handler')
+        if context is not None and handler_object is not None:
+            context['handler'] = handler_object.callback.__name__
+        return await handler(event, data)
+
+
+def setup_middlewares(dp):
+    dp.update.outer_middleware(LoggingMiddleware())
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(HandlerNameMiddleware())
@@ -1,34 +1,44 @@
 import os
 import asyncio
-import aiohttp
 import random
 import json
+import html
 import logging
+import threading
+import time
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
-from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
-from dotenv import load_dotenv
-import storage
-from keep_alive import keep_alive
 from collections import Counter
+import startup
+
+# Замеряем тяжелые импорты для профиля запуска.
+# Flask (keep_alive) и psutil грузятся в фоновом потоке, см. start_keep_alive
+with startup.phase("import aiogram"):
+    from aiogram import Bot, Dispatcher, types, F
+    from aiogram.filters import Command
+    from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+    from aiogram.fsm.state import State, StatesGroup
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+with startup.phase("import модулей бота"):
+    from dotenv import load_dotenv
+    import storage
+    import http_client
+    import logging_setup
+    from outbox import outbox
+    from cache import api_cache
+    from match_cache import match_cache
+    import render
+    from render import render_cache
+    from lifecycle import lifecycle, save_snapshot, load_snapshot
 
 # ========== НАСТРОЙКА ДЛЯ RAILWAY ==========
 # Railway требует специальной настройки вебхуков или long-polling
 # Эта версия совместима с Railway
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: запись на диск в отдельном потоке, JSON с ротацией
+logging_setup.setup_logging()
 logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения
@@ -36,6 +46,7 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 STEAM_API_KEY = os.getenv("STEAM_API_KEY")
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
 
 # Критические проверки
 if not BOT_TOKEN:
@@ -49,15 +60,20 @@ if not BOT_TOKEN:
 bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
 dp = Dispatcher(storage=MemoryStorage())
 
-# Инициализация БД
-try:
-    storage.init_db()
-    logger.info("✅ База данных инициализирована")
-except Exception as e:
-    logger.error(f"❌ Ошибка инициализации БД: {e}")
-    # Продолжаем без БД, если это возможно
+# Все исходящие запросы идут через очередь с лимитами
+outbox.setup(bot)
+
+# Контекст апдейта (update_id, user_id, хендлер, задержка) для логов
+logging_setup.setup_middlewares(dp)
+
+# Учет апдейтов в обработке для корректной остановки
+dp.update.outer_middleware(lifecycle.middleware())
+
+# БД, константы и HTTP-пул инициализируются параллельно в warm_up()
 
 # ========== КОНФИГУРАЦИЯ ==========
+OPENDOTA_URL = "https://api.opendota.com"
+
 RANK_TIER_MMR = {
     11: 10, 12: 160, 13: 310, 14: 460, 15: 610,
     21: 760, 22: 910, 23: 1060, 24: 1210, 25: 1360,
@@ -97,13 +113,12 @@ async def extract_account_id_safe(steam_url: str):
             if not STEAM_API_KEY:
                 return None
             vanity = steam_url.split("/")[-1]
-            async with aiohttp.ClientSession() as session:
-                url = f"https://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/?key={STEAM_API_KEY}&vanityurl={vanity}"
-                async with session.get(url, timeout=10) as r:
-                    data = await r.json()
-                    if data.get("response", {}).get("success") == 1:
-                        steam64 = int(data["response"]["steamid"])
-                        return steam64_to_account_id(steam64)
+            url = f"https://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/?key={STEAM_API_KEY}&vanityurl={vanity}"
+            async with http_client.request(url, timeout=10) as r:
+                data = await r.json()
+                if data.get("response", {}).get("success") == 1:
+                    steam64 = int(data["response"]["steamid"])
+                    return steam64_to_account_id(steam64)
         
         elif steam_url.isdigit():
             num = int(steam_url)
@@ -117,34 +132,68 @@ async def extract_account_id_safe(steam_url: str):
         return None
 
 async def get_player_data(account_id: int):
+    return await api_cache.get_or_fetch(
+        f"player:{account_id}", lambda: _fetch_player_data(account_id)
+    )
+
+async def _fetch_player_data(account_id: int):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://api.opendota.com/api/players/{account_id}",
-                timeout=10
-            ) as r:
-                if r.status == 200:
-                    return await r.json()
-                return None
+        async with http_client.request(
+            f"https://api.opendota.com/api/players/{account_id}",
+            timeout=10
+        ) as r:
+            if r.status == 200:
+                return await r.json()
+            return None
     except Exception as e:
         logger.error(f"Ошибка получения данных игрока: {e}")
         return None
 
 async def get_recent_matches(account_id: int, limit=20):
+    matches = await api_cache.get_or_fetch(
+        f"recent:{account_id}", lambda: _fetch_recent_matches(account_id)
+    )
+    return matches[:limit]
+
+async def _fetch_recent_matches(account_id: int):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://api.opendota.com/api/players/{account_id}/recentMatches",
-                timeout=15
-            ) as r:
-                if r.status == 200:
-                    matches = await r.json()
-                    return matches[:limit] if isinstance(matches, list) else []
-                return []
+        async with http_client.request(
+            f"https://api.opendota.com/api/players/{account_id}/recentMatches",
+            timeout=15
+        ) as r:
+            if r.status == 200:
+                matches = await r.json()
+                return matches if isinstance(matches, list) else []
+            return []
     except Exception as e:
         logger.error(f"Ошибка получения матчей: {e}")
         return []
 
+BENCHMARK_METRICS = {
+    'gold_per_min': '💰 GPM',
+    'xp_per_min': '📈 XPM',
+    'hero_damage_per_min': '💥 Урон',
+    'kills_per_min': '⚔️ Убийств'
+}
+
+async def get_benchmarks(account_id: int):
+    return await api_cache.get_or_fetch(
+        f"bench:{account_id}", lambda: _fetch_benchmarks(account_id)
+    )
+
+async def _fetch_benchmarks(account_id: int):
+    try:
+        async with http_client.request(
+            f"https://api.opendota.com/api/players/{account_id}/benchmarks",
+            timeout=15
+        ) as r:
+            if r.status == 200:
+                return await r.json()
+            return None
+    except Exception as e:
+        logger.error(f"Ошибка получения бенчмарков: {e}")
+        return None
+
 async def get_heroes_data():
     global HEROES_CACHE
     if HEROES_CACHE:
@@ -157,24 +206,87 @@ async def get_heroes_data():
             return HEROES_CACHE
     except:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "https://api.opendota.com/api/constants/heroes",
-                    timeout=15
-                ) as r:
-                    if r.status == 200:
-                        data = await r.json()
-                        HEROES_CACHE = {int(k): v['localized_name'] for k, v in data.items()}
-                        return HEROES_CACHE
+            async with http_client.request(
+                "https://api.opendota.com/api/constants/heroes",
+                timeout=15
+            ) as r:
+                if r.status == 200:
+                    data = await r.json()
+                    HEROES_CACHE = {int(k): v['localized_name'] for k, v in data.items()}
+                    return HEROES_CACHE
         except:
             return {}
 
+def get_items_data():
+    global ITEMS_CACHE
+    if ITEMS_CACHE:
+        return ITEMS_CACHE
+    
+    try:
+        with open('item_ids.json', 'r', encoding='utf-8') as f:
+            ITEMS_CACHE = {int(k): v for k, v in json.load(f).items()}
+    except Exception as e:
+        logger.error(f"Ошибка загрузки предметов: {e}")
+    return ITEMS_CACHE
+
+# Поля матча, нужные экрану деталей: в памяти держим только их
+MATCH_FIELDS = ('radiant_win', 'duration', 'radiant_score', 'dire_score', 'version')
+MATCH_PLAYER_FIELDS = (
+    'account_id', 'hero_id', 'player_slot', 'kills', 'deaths', 'assists',
+    'net_worth', 'gold_per_min', 'xp_per_min', 'lane_role',
+    'item_0', 'item_1', 'item_2', 'item_3', 'item_4', 'item_5'
+)
+MATCH_MEMORY_TTL = 300
+
+def trim_match(match: dict):
+    trimmed = {key: match.get(key) for key in MATCH_FIELDS}
+    trimmed['players'] = [
+        {key: p.get(key) for key in MATCH_PLAYER_FIELDS}
+        for p in match.get('players', [])
+    ]
+    return trimmed
+
+async def get_match_details(match_id: int):
+    # Полный матч живет на диске, в памяти - только урезанная проекция.
+    # Неразобранный матч (без линий) еще дополнится, поэтому его держим недолго
+    return await api_cache.get_or_fetch(
+        f"match:{match_id}", lambda: _load_match_details(match_id), ttl=MATCH_MEMORY_TTL
+    )
+
+async def _load_match_details(match_id: int):
+    match = await match_cache.get(match_id)
+    if match:
+        return trim_match(match)
+    
+    try:
+        async with http_client.request(
+            f"https://api.opendota.com/api/matches/{match_id}",
+            timeout=15
+        ) as r:
+            if r.status != 200:
+                return None
+            match = await r.json()
+    except Exception as e:
+        logger.error(f"Ошибка получения матча: {e}")
+        return None
+    
+    # На диск навсегда - только разобранные матчи, они уже не изменятся
+    if match.get('version'):
+        await match_cache.put(match_id, match)
+    return trim_match(match)
+
+def stale_note(*keys):
+    """Пометка для ответа, если OpenDota не ответил и показаны данные из кеша"""
+    if any(api_cache.is_stale(key) for key in keys):
+        return "\n\n⚠️ <i>OpenDota недоступен, показаны сохраненные данные</i>"
+    return ""
+
 # ========== КЛАВИАТУРЫ ==========
 def get_main_keyboard():
     builder = ReplyKeyboardBuilder()
     buttons = [
         "👤 Профиль", "📊 Анализ", "🎮 Викторина",
-        "👥 Друзья", "🏆 Топ игроков", "ℹ️ Помощь"
+        "👥 Друзья", "🏆 Топ игроков", "📈 Мета", "ℹ️ Помощь"
     ]
     for btn in buttons:
         builder.button(text=btn)
@@ -222,6 +334,7 @@ async def process_steam_url(message: types.Message, steam_url: str):
         
         profile_name = player_data.get('profile', {}).get('personaname', 'Игрок')
         storage.bind_user(message.from_user.id, account_id)
+        render_cache.bump("leaderboard")
         
         await message.answer(
             f"✅ Профиль привязан!\n"
@@ -245,28 +358,82 @@ async def profile_command(message: types.Message):
         await message.answer("❌ Не удалось получить данные профиля.")
         return
     
-    profile = player_data.get('profile', {})
-    profile_name = profile.get('personaname', 'Неизвестно')
+    profile = player_data.get('profile') or {}
+    profile_name = profile.get('personaname') or 'Неизвестно'
     mmr = player_data.get('mmr_estimate', {}).get('estimate', 'Неизвестно')
     
     matches = await get_recent_matches(account_id, 5)
-    matches_text = ""
+    rows = []
+    keyboard = InlineKeyboardBuilder()
     if matches:
         heroes = await get_heroes_data()
         for m in matches[:3]:
             hero_id = m.get('hero_id', 0)
             hero_name = heroes.get(hero_id, f"Герой {hero_id}")
-            k, d, a = m.get('kills', 0), m.get('deaths', 0), m.get('assists', 0)
             win = ((m['player_slot'] < 128) == m.get('radiant_win', False))
-            outcome = "✅" if win else "❌"
-            matches_text += f"{outcome} {hero_name}: {k}/{d}/{a}\n"
+            rows.append({
+                'outcome': "✅" if win else "❌",
+                'hero': hero_name,
+                'kills': m.get('kills', 0),
+                'deaths': m.get('deaths', 0),
+                'assists': m.get('assists', 0),
+            })
+            keyboard.button(text=f"🔍 {hero_name}", callback_data=f"match_{m['match_id']}_{account_id}")
+    keyboard.adjust(1)
+    
+    response = render.PROFILE.render(rows, name=html.escape(profile_name), mmr=mmr)
+    response += stale_note(f"player:{account_id}", f"recent:{account_id}")
+    await message.answer(response, parse_mode="HTML", reply_markup=keyboard.as_markup())
+
+LANES = {1: "Лёгкая", 2: "Центр", 3: "Сложная", 4: "Лес"}
+
+@dp.callback_query(F.data.startswith("match_"))
+async def match_details_callback(callback: types.CallbackQuery):
+    # Аккаунт берем из кнопки: ее может нажать и другой участник группы
+    parts = callback.data.split("_")
+    if len(parts) != 3:
+        await callback.answer("❌ Кнопка устарела, откройте профиль заново", show_alert=True)
+        return
+    match_id, account_id = int(parts[1]), int(parts[2])
+    
+    match = await get_match_details(match_id)
+    if not match:
+        await callback.answer("❌ Не удалось получить матч", show_alert=True)
+        return
+    
+    player = next(
+        (p for p in match.get('players', []) if p.get('account_id') == account_id),
+        None
+    )
+    if not player:
+        await callback.answer("❌ Игрок не найден в матче", show_alert=True)
+        return
+    
+    heroes = await get_heroes_data()
+    items = get_items_data()
+    
+    hero_id = player.get('hero_id', 0)
+    hero_name = heroes.get(hero_id, f"Герой {hero_id}")
+    win = (player.get('player_slot', 0) < 128) == match.get('radiant_win', False)
+    duration = match.get('duration', 0)
+    item_names = [
+        items.get(player[f'item_{i}'], f"#{player[f'item_{i}']}")
+        for i in range(6) if player.get(f'item_{i}')
+    ]
+    lane = LANES.get(player.get('lane_role'), "Неизвестно")
     
     response = (
-        f"👤 <b>{profile_name}</b>\n"
-        f"🎯 MMR: {mmr}\n\n"
-        f"<b>Последние игры:</b>\n{matches_text}"
+        f"{'✅ Победа' if win else '❌ Поражение'} • <b>{hero_name}</b>\n"
+        f"🆔 Матч {match_id} • ⏱ {duration // 60}:{duration % 60:02d}\n"
+        f"⚔️ Счет: {match.get('radiant_score', 0)} - {match.get('dire_score', 0)}\n\n"
+        f"K/D/A: {player.get('kills', 0)}/{player.get('deaths', 0)}/{player.get('assists', 0)}\n"
+        f"💰 Net worth: {player.get('net_worth', 0)}\n"
+        f"📈 GPM/XPM: {player.get('gold_per_min', 0)}/{player.get('xp_per_min', 0)}\n"
+        f"🛣 Линия: {lane}\n\n"
+        f"<b>Предметы:</b>\n{', '.join(item_names) or 'Нет данных'}"
     )
-    await message.answer(response, parse_mode="HTML")
+    await callback.message.answer(response, parse_mode="HTML")
+    await callback.answer()
 
 @dp.message(F.text == "📊 Анализ")
 async def analyze_command(message: types.Message):
@@ -275,32 +442,21 @@ async def analyze_command(message: types.Message):
         await message.answer("❌ Сначала привяжите профиль.")
         return
     
+    bench = await get_benchmarks(account_id)
+    if not bench:
+        await message.answer("❌ Нет данных для анализа.")
+        return
+    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://api.opendota.com/api/players/{account_id}/benchmarks",
-                timeout=15
-            ) as r:
-                if r.status == 200:
-                    bench = await r.json()
-                    response = "📊 <b>Анализ производительности:</b>\n\n"
-                    
-                    metrics = {
-                        'gold_per_min': '💰 GPM',
-                        'xp_per_min': '📈 XPM',
-                        'hero_damage_per_min': '💥 Урон',
-                        'kills_per_min': '⚔️ Убийств'
-                    }
-                    
-                    for key, label in metrics.items():
-                        if key in bench and bench[key]:
-                            percentile = bench[key][-1].get('percentile', 0)
-                            value = bench[key][-1].get('value', 0)
-                            response += f"{label}: {value:.1f} (лучше чем {percentile*100:.1f}% игроков)\n"
-                    
-                    await message.answer(response, parse_mode="HTML")
-                else:
-                    await message.answer("❌ Нет данных для анализа.")
+        response = "📊 <b>Анализ производительности:</b>\n\n"
+        for key, label in BENCHMARK_METRICS.items():
+            if key in bench and bench[key]:
+                percentile = bench[key][-1].get('percentile', 0)
+                value = bench[key][-1].get('value', 0)
+                response += f"{label}: {value:.1f} (лучше чем {percentile*100:.1f}% игроков)\n"
+        response += stale_note(f"bench:{account_id}")
+        
+        await message.answer(response, parse_mode="HTML")
     except Exception as e:
         logger.error(f"Ошибка анализа: {e}")
         await message.answer("❌ Ошибка при анализе.")
@@ -346,6 +502,7 @@ async def quiz_answer_callback(callback: types.CallbackQuery):
     
     if answer_type == "correct":
         storage.update_score(callback.from_user.id, 10)
+        render_cache.bump("leaderboard")
         await callback.message.edit_text("✅ Правильно! +10 очков")
     else:
         await callback.message.edit_text("❌ Неправильно!")
@@ -354,26 +511,29 @@ async def quiz_answer_callback(callback: types.CallbackQuery):
 
 @dp.callback_query(F.data == "quiz_leaderboard")
 async def quiz_leaderboard_callback(callback: types.CallbackQuery):
-    leaders = storage.get_leaderboard(5)
-    response = "🏆 <b>Топ игроков:</b>\n\n"
-    
-    for i, leader in enumerate(leaders, 1):
-        response += f"{i}. ID {leader['telegram_id']}: {leader['score']} очков\n"
-    
+    response = render_leaderboard(5, "Топ игроков")
     await callback.message.edit_text(response, parse_mode="HTML")
 
 # ========== ДРУГИЕ КОМАНДЫ ==========
 @dp.message(F.text == "👥 Друзья")
 async def friends_command(message: types.Message):
-    friends = storage.get_friends(message.from_user.id)
-    if not friends:
+    telegram_id = message.from_user.id
+    
+    def render_friends():
+        friends = storage.get_friends(telegram_id)
+        if not friends:
+            return None
+        rows = [
+            {**friend, 'friend_name': html.escape(friend['friend_name'] or '')}
+            for friend in friends
+        ]
+        return render.FRIENDS.render(rows)
+    
+    response = render_cache.get_or_render(f"friends:{telegram_id}", None, render_friends)
+    if not response:
         await message.answer("У вас нет друзей. Добавьте командой:\n`/addfriend ссылка_на_стим`")
         return
     
-    response = "👥 <b>Ваши друзья:</b>\n\n"
-    for friend in friends:
-        response += f"• {friend['friend_name']} (ID: {friend['friend_account_id']})\n"
-    
     await message.answer(response, parse_mode="HTML")
 
 @dp.message(Command("addfriend"))
@@ -395,18 +555,177 @@ async def addfriend_command(message: types.Message):
     
     name = player_data.get('profile', {}).get('personaname', 'Друг')
     storage.add_friend(message.from_user.id, account_id, name)
+    render_cache.bump(f"friends:{message.from_user.id}")
     await message.answer(f"✅ Друг {name} добавлен!")
 
+def is_win(match: dict):
+    return (match.get('player_slot', 0) < 128) == bool(match.get('radiant_win'))
+
+def compare_matches(matches_a: list, matches_b: list):
+    """Сравнение по недавним матчам: общие игры, винрейты, пересечение героев"""
+    by_id_b = {m['match_id']: m for m in matches_b}
+    shared = [(m, by_id_b[m['match_id']]) for m in matches_a if m['match_id'] in by_id_b]
+    together = [a for a, b in shared if (a['player_slot'] < 128) == (b['player_slot'] < 128)]
+    against = [a for a, b in shared if (a['player_slot'] < 128) != (b['player_slot'] < 128)]
+    
+    heroes_a = Counter(m['hero_id'] for m in matches_a)
+    heroes_b = Counter(m['hero_id'] for m in matches_b)
+    common = heroes_a & heroes_b
+    
+    def winrate(matches):
+        return sum(map(is_win, matches)) / len(matches) * 100 if matches else 0
+    
+    return {
+        'winrate_a': winrate(matches_a),
+        'winrate_b': winrate(matches_b),
+        'shared': len(shared),
+        'together': len(together),
+        'together_winrate': winrate(together),
+        'against': len(against),
+        'against_wins_a': sum(map(is_win, against)),
+        'common_heroes': [hero_id for hero_id, _ in common.most_common(5)],
+    }
+
+@dp.message(Command("compare"))
+async def compare_command(message: types.Message):
+    args = message.text.split()[1:]
+    if len(args) == 1:
+        own_account_id = storage.get_account_id(message.from_user.id)
+        if not own_account_id:
+            await message.answer("❌ Профиль не привязан. Используйте /bind или укажите два аккаунта.")
+            return
+        args = [str(own_account_id)] + args
+    if len(args) != 2:
+        await message.answer("Использование: /compare ссылка_1 ссылка_2\nили /compare ссылка - сравнить с собой")
+        return
+    
+    account_a, account_b = await asyncio.gather(*(extract_account_id_safe(a) for a in args))
+    if not account_a or not account_b:
+        await message.answer("❌ Неверная ссылка.")
+        return
+    
+    # Все запросы параллельно и через кеш: уже просмотренный друг не стоит запросов
+    player_a, player_b, matches_a, matches_b, bench_a, bench_b = await asyncio.gather(
+        get_player_data(account_a), get_player_data(account_b),
+        get_recent_matches(account_a), get_recent_matches(account_b),
+        get_benchmarks(account_a), get_benchmarks(account_b)
+    )
+    if not player_a or not player_b:
+        await message.answer("❌ Не удалось получить данные игроков.")
+        return
+    
+    stats = compare_matches(matches_a, matches_b)
+    heroes = await get_heroes_data()
+    name_a = html.escape((player_a.get('profile') or {}).get('personaname') or str(account_a))
+    name_b = html.escape((player_b.get('profile') or {}).get('personaname') or str(account_b))
+    
+    lines = [
+        f"⚔️ <b>{name_a}</b> vs <b>{name_b}</b>\n",
+        f"🏆 Винрейт (последние игры): {stats['winrate_a']:.0f}% / {stats['winrate_b']:.0f}%",
+        f"🤝 Общих матчей: {stats['shared']}",
+    ]
+    if stats['together']:
+        lines.append(f"  • вместе: {stats['together']}, побед {stats['together_winrate']:.0f}%")
+    if stats['against']:
+        lines.append(
+            f"  • друг против друга: {stats['against']}, "
+            f"счет {stats['against_wins_a']}:{stats['against'] - stats['against_wins_a']}"
+        )
+    if stats['common_heroes']:
+        common = ", ".join(heroes.get(h, f"Герой {h}") for h in stats['common_heroes'])
+        lines.append(f"🦸 Общие герои: {common}")
+    
+    if bench_a and bench_b:
+        lines.append("\n📊 <b>Бенчмарки:</b>")
+        for key, label in BENCHMARK_METRICS.items():
+            if bench_a.get(key) and bench_b.get(key):
+                value_a = bench_a[key][-1].get('value', 0)
+                value_b = bench_b[key][-1].get('value', 0)
+                lines.append(f"{label}: {value_a:.1f} / {value_b:.1f}")
+    
+    response = "\n".join(lines) + stale_note(*(
+        f"{kind}:{account_id}"
+        for kind in ("player", "recent", "bench")
+        for account_id in (account_a, account_b)
+    ))
+    await message.answer(response, parse_mode="HTML")
+
 @dp.message(F.text == "🏆 Топ игроков")
 async def leaderboard_command(message: types.Message):
-    leaders = storage.get_leaderboard(10)
-    response = "🏆 <b>Топ игроков бота:</b>\n\n"
+    response = render_leaderboard(10, "Топ игроков бота")
+    await message.answer(response, parse_mode="HTML")
+
+def render_leaderboard(limit: int, title: str):
+    # Версия "leaderboard" меняется при изменении очков, до этого БД не трогаем
+    def render_fresh():
+        leaders = storage.get_leaderboard(limit)
+        rows = [{**leader, 'pos': i} for i, leader in enumerate(leaders, 1)]
+        return render.LEADERBOARD.render(rows, title=title)
+    
+    return render_cache.get_or_render("leaderboard", (limit, title), render_fresh)
+
+@dp.message(F.text == "📈 Мета")
+@dp.message(Command("meta"))
+async def meta_command(message: types.Message):
+    heroes = await get_heroes_data()
     
-    for i, leader in enumerate(leaders, 1):
-        response += f"{i}. ID {leader['telegram_id']}: {leader['score']} очков\n"
+    def render_meta():
+        total, heroes_stats = storage.get_hero_meta(10)
+        if not heroes_stats:
+            return None
+        rows = []
+        for i, h in enumerate(heroes_stats, 1):
+            picks = h['picks']
+            rows.append({
+                'pos': i,
+                'hero': heroes.get(h['hero_id'], f"Герой {h['hero_id']}"),
+                'pick_rate': picks / total * 100,
+                'win_rate': h['wins'] / picks * 100,
+                'kills': h['kills'] / picks,
+                'deaths': h['deaths'] / picks,
+                'assists': h['assists'] / picks,
+                'kda': (h['kills'] + h['assists']) / max(h['deaths'], 1),
+            })
+        return render.META.render(rows, total=total)
+    
+    response = render_cache.get_or_render("meta", None, render_meta)
+    if not response:
+        await message.answer("📈 Статистика еще собирается, загляните позже.")
+        return
     
     await message.answer(response, parse_mode="HTML")
 
+@dp.message(Command("broadcast"))
+async def broadcast_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    
+    text = message.text.partition(" ")[2].strip()
+    if not text:
+        await message.answer("Использование: /broadcast текст")
+        return
+    
+    count = outbox.broadcast(storage.get_all_user_ids(), text)
+    await message.answer(f"📨 Рассылка поставлена в очередь: {count} получателей")
+
+@dp.message(Command("queue"))
+async def queue_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    
+    stats = outbox.stats()
+    await message.answer(
+        "📊 <b>Очередь отправки:</b>\n\n"
+        f"Отправлено: {stats['sent']}\n"
+        f"За минуту: {stats['per_minute']}\n"
+        f"В очереди: {stats['queued']}\n"
+        f"Повторов (RetryAfter): {stats['retried']}\n"
+        f"Ошибок: {stats['failed']}\n\n"
+        f"OpenDota: {http_client.get_breaker(OPENDOTA_URL).state}\n"
+        f"Отдано устаревших ответов: {api_cache.stale_served}",
+        parse_mode="HTML"
+    )
+
 @dp.message(F.text == "ℹ️ Помощь")
 async def help_command(message: types.Message):
     help_text = (
@@ -417,10 +736,131 @@ async def help_command(message: types.Message):
         "/profile - Ваш профиль\n"
         "/analyze - Анализ статистики\n"
         "/addfriend - Добавить друга\n"
+        "/compare - Сравнить двух игроков\n"
         "\n<b>Или используйте кнопки меню!</b>"
     )
     await message.answer(help_text, parse_mode="HTML")
 
+# ========== INLINE-РЕЖИМ ==========
+INLINE_DEBOUNCE = 0.6
+INLINE_FETCH_TIMEOUT = 4
+INLINE_MAX_RESULTS = 20
+INLINE_LATEST = {}  # user_id -> id последнего inline-запроса
+HERO_ARTICLES = {}  # hero_id -> готовая карточка героя
+
+def hero_article(hero_id: int, name: str):
+    article = HERO_ARTICLES.get(hero_id)
+    if article is None:
+        article = InlineQueryResultArticle(
+            id=f"hero_{hero_id}",
+            title=name,
+            description="Герой на OpenDota",
+            input_message_content=InputTextMessageContent(
+                message_text=f"🦸 <b>{name}</b>\nhttps://www.opendota.com/heroes/{hero_id}",
+                parse_mode="HTML"
+            )
+        )
+        HERO_ARTICLES[hero_id] = article
+    return article
+
+def player_article(account_id: int, player_data: dict):
+    key = f"inline:{account_id}"
+    article = api_cache.get(key)
+    if article is None:
+        profile = player_data.get('profile') or {}
+        name = html.escape(profile.get('personaname') or 'Игрок')
+        mmr = (player_data.get('mmr_estimate') or {}).get('estimate', 'Неизвестно')
+        article = InlineQueryResultArticle(
+            id=f"player_{account_id}",
+            title=f"👤 {name}",
+            description=f"MMR: {mmr} • ID {account_id}",
+            thumbnail_url=profile.get('avatarmedium'),
+            input_message_content=InputTextMessageContent(
+                message_text=(
+                    f"👤 <b>{name}</b>\n"
+                    f"🎯 MMR: {mmr}\n"
+                    f"🆔 Account ID: {account_id}\n"
+                    f"https://www.opendota.com/players/{account_id}"
+                ),
+                parse_mode="HTML"
+            )
+        )
+        api_cache.set(key, article)
+    return article
+
+def info_article(result_id: str, title: str, text: str):
+    return InlineQueryResultArticle(
+        id=result_id,
+        title=title,
+        input_message_content=InputTextMessageContent(message_text=text)
+    )
+
+async def inline_player_results(query: types.InlineQuery, text: str):
+    # Сначала пробуем ответить из кеша без сетевых запросов
+    if text.isdigit():
+        num = int(text)
+        account_id = steam64_to_account_id(num) if num > 76561197960265728 else num
+        cached = api_cache.get(f"player:{account_id}")
+        if cached:
+            return [player_article(account_id, cached)], 300
+    
+    # Дебаунс: пока пользователь печатает, в OpenDota не ходим
+    user_id = query.from_user.id
+    INLINE_LATEST[user_id] = query.id
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if INLINE_LATEST.get(user_id) != query.id:
+        return None, 0
+    
+    try:
+        account_id = await asyncio.wait_for(extract_account_id_safe(text), INLINE_FETCH_TIMEOUT)
+        if not account_id:
+            return [info_article("not_found", "❌ Профиль не найден", "Профиль не найден")], 60
+        # Загрузка продолжится в кеш даже после таймаута
+        player_data = await asyncio.wait_for(get_player_data(account_id), INLINE_FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        return [info_article("loading", "⏳ Загрузка...", "Попробуйте еще раз через пару секунд")], 1
+    finally:
+        if INLINE_LATEST.get(user_id) == query.id:
+            del INLINE_LATEST[user_id]
+    
+    if not player_data:
+        return [info_article("not_found", "❌ Нет данных", "Не удалось получить данные игрока")], 30
+    return [player_article(account_id, player_data)], 300
+
+async def inline_hero_results(text: str):
+    heroes = await get_heroes_data()
+    needle = text.lower()
+    found = [(hero_id, name) for hero_id, name in heroes.items() if needle in name.lower()]
+    # Совпадения с начала имени выше
+    found.sort(key=lambda h: (not h[1].lower().startswith(needle), h[1]))
+    return [hero_article(hero_id, name) for hero_id, name in found[:INLINE_MAX_RESULTS]]
+
+@dp.inline_query()
+async def inline_query_handler(query: types.InlineQuery):
+    text = query.query.strip()
+    
+    if not text:
+        await query.answer(
+            [info_article("help", "🔎 Поиск игрока или героя",
+                          "Введите account_id, ссылку на Steam или имя героя")],
+            cache_time=3600
+        )
+        return
+    
+    if text.isdigit() or "steamcommunity.com" in text:
+        results, cache_time = await inline_player_results(query, text)
+        if results is None:
+            # Запрос устарел - пользователь уже напечатал больше
+            return
+        await query.answer(results, cache_time=cache_time)
+        return
+    
+    results = await inline_hero_results(text)
+    if not results:
+        results = [info_article("not_found", "❌ Ничего не найдено", "Герой не найден")]
+    # Справочник героев статичен - Telegram может долго держать ответ у себя
+    await query.answer(results, cache_time=3600)
+
 @dp.message()
 async def handle_steam_url(message: types.Message):
     """Обработка Steam ссылок напрямую"""
@@ -430,27 +870,142 @@ async def handle_steam_url(message: types.Message):
     else:
         await message.answer("Используйте кнопки меню или отправьте ссылку на Steam профиль.")
 
+# ========== АГРЕГАЦИЯ МЕТЫ ==========
+META_INTERVAL = 3600
+# Бесплатный OpenDota - 60 запросов в минуту на всех. Фоновой задаче
+# оставляем ~15 в минуту, остальное - запросам пользователей
+META_REQUEST_DELAY = 4.0
+META_START_DELAY = 120  # не конкурируем с первыми запросами пользователей после деплоя
+
+async def fetch_matches_for_meta(account_id: int):
+    """Матчи аккаунта для меты; пока breaker OpenDota не замкнут - ждем,
+    а не пропускаем аккаунт с пустым ответом"""
+    breaker = http_client.get_breaker(OPENDOTA_URL)
+    while True:
+        if breaker.state == "open":
+            logger.info("⏸ Агрегация меты на паузе: OpenDota недоступен")
+            while breaker.state == "open":
+                await asyncio.sleep(http_client.RESET_TIMEOUT)
+        matches = await get_recent_matches(account_id)
+        await asyncio.sleep(META_REQUEST_DELAY)
+        if breaker.state == "closed":
+            return matches
+
+async def aggregate_hero_meta():
+    """Добавляет в hero_stats новые матчи всех привязанных аккаунтов"""
+    account_ids = await asyncio.to_thread(storage.get_all_account_ids)
+    added = 0
+    for account_id in account_ids:
+        matches = await fetch_matches_for_meta(account_id)
+        if matches:
+            added += await asyncio.to_thread(storage.record_matches, account_id, matches)
+    if added:
+        render_cache.bump("meta")
+    logger.info(f"📈 Мета обновлена: {len(account_ids)} аккаунтов, {added} новых матчей")
+
+async def meta_aggregation_loop():
+    await asyncio.sleep(META_START_DELAY)
+    while True:
+        try:
+            await aggregate_hero_meta()
+        except Exception as e:
+            logger.error(f"Ошибка агрегации меты: {e}")
+        await asyncio.sleep(META_INTERVAL)
+
 # ========== ЗАПУСК БОТА ДЛЯ RAILWAY ==========
+def start_keep_alive():
+    """Flask и psutil импортируются в фоновом потоке, не задерживая запуск бота"""
+    def run():
+        with startup.phase("keep-alive (import flask)"):
+            import keep_alive
+        keep_alive.keep_alive()
+        logger.info("✅ Keep-alive сервер запущен")
+    
+    threading.Thread(target=run, daemon=True).start()
+
+async def restore_snapshot():
+    """Поднимает кеш и очередь рассылки, сохраненные при прошлой остановке"""
+    snapshot = await asyncio.to_thread(load_snapshot)
+    if not snapshot:
+        return
+    elapsed = time.time() - snapshot.get('saved_at', time.time())
+    restored = api_cache.load(snapshot.get('cache', []), elapsed)
+    outbox.restore(snapshot.get('outbox', []))
+    logger.info(f"♻️ Из снимка восстановлено {restored} записей кеша")
+
+async def shutdown():
+    """Дожидается хендлеров, сохраняет кеш и закрывает соединения"""
+    logger.info("🛑 Остановка бота...")
+    startup.ready.clear()
+    await lifecycle.drain()
+    await lifecycle.cancel_tasks()
+    pending = await outbox.stop()
+    
+    snapshot = {"saved_at": time.time(), "cache": api_cache.dump(), "outbox": pending}
+    try:
+        await asyncio.to_thread(save_snapshot, snapshot)
+        logger.info(f"💾 Снимок сохранен: {len(snapshot['cache'])} записей кеша, {len(pending)} в рассылке")
+    except (OSError, TypeError) as e:
+        logger.error(f"❌ Не удалось сохранить снимок: {e}")
+    
+    # БД без пула (соединение на запрос), закрывать нечего
+    await http_client.close()
+    await bot.session.close()
+    logger.info("👋 Бот остановлен")
+
+async def warm_up():
+    """Параллельно готовит БД, константы, HTTP-пул и long-polling"""
+    results = await asyncio.gather(
+        startup.timed("init_db", asyncio.to_thread(storage.init_db)),
+        startup.timed("cache snapshot", restore_snapshot()),
+        startup.timed("heroes", get_heroes_data()),
+        startup.timed("items", asyncio.to_thread(get_items_data)),
+        startup.timed("http pool", http_client.warm_up()),
+        # На Railway нужно использовать long-polling.
+        # Апдейты, пришедшие во время редеплоя, не выбрасываем
+        startup.timed("delete_webhook", bot.delete_webhook(drop_pending_updates=False)),
+        return_exceptions=True
+    )
+    db_result, snapshot_result, *_, webhook_result = results
+    
+    if isinstance(db_result, Exception):
+        # Продолжаем без БД, если это возможно
+        logger.error(f"❌ Ошибка инициализации БД: {db_result}")
+    if isinstance(snapshot_result, Exception):
+        logger.error(f"❌ Ошибка восстановления снимка: {snapshot_result}")
+    if isinstance(webhook_result, Exception):
+        raise webhook_result
+    logger.info("✅ Webhook удален, используем long-polling")
+
 async def main():
     """Главная функция для Railway"""
     logger.info("🚀 Запуск бота на Railway...")
     
     # Запускаем keep-alive сервер
-    keep_alive()
-    logger.info("✅ Keep-alive сервер запущен")
+    start_keep_alive()
     
     # Запускаем long-polling бота
     try:
-        # На Railway нужно использовать long-polling
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("✅ Webhook удален, используем long-polling")
+        with startup.phase("warm-up"):
+            await warm_up()
+        
+        # Запускаем воркер рассылок
+        outbox.start()
+        
+        # Периодически пересчитываем мету героев
+        lifecycle.create_task(meta_aggregation_loop())
         
+        startup.mark_ready()
         logger.info("🤖 Бот запущен и ожидает сообщений...")
-        await dp.start_polling(bot)
+        # aiogram сам ловит SIGTERM/SIGINT и останавливает polling;
+        # сессию бота закрываем сами, после того как хендлеры доработают
+        await dp.start_polling(bot, close_bot_session=False)
         
     except Exception as e:
         logger.error(f"❌ Ошибка запуска бота: {e}")
         raise
+    finally:
+        await shutdown()
 
 # ========== ТОЧКА ВХОДА ==========
 if __name__ == "__main__":
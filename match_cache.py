@@ -0,0 +1,152 @@
+import os
+import gzip
+import json
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MATCH_CACHE_DIR = os.getenv('MATCH_CACHE_DIR', 'match_cache')
+MATCH_CACHE_MAX_BYTES = int(os.getenv('MATCH_CACHE_MAX_MB', '200')) * 1024 * 1024
+
+# Сжимаем zstd, если он установлен, иначе gzip
+EXT = '.json.zst' if zstandard else '.json.gz'
+
+
+def _compress(raw: bytes) -> bytes:
+    if zstandard:
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return gzip.compress(raw, compresslevel=6)
+
+
+def _decompress(blob: bytes, path: str) -> bytes:
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("zstandard не установлен")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+class MatchCache:
+    """Дисковый кеш матчей: матч неизменяем, поэтому качаем его один раз"""
+
+    def __init__(self, directory=MATCH_CACHE_DIR, max_bytes=MATCH_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = None  # match_id -> (path, size), порядок = LRU
+        self._total = 0
+        # Индекс меняется из потоков asyncio.to_thread
+        self._lock = threading.Lock()
+
+    def _path(self, match_id: int):
+        # Шардируем по младшему байту, чтобы не держать тысячи файлов в одной папке
+        return os.path.join(self.directory, f"{match_id % 256:02x}", f"{match_id}{EXT}")
+
+    def _load_index(self):
+        """Строит LRU-индекс по существующим файлам (старые по mtime - первые)"""
+        entries = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.endswith('.tmp'):
+                        # Недописанный файл от убитого процесса
+                        self._remove(path)
+                        continue
+                    match_id = name[:-len(EXT)]
+                    if not name.endswith(EXT) or not match_id.isdigit():
+                        continue
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, int(match_id), path, st.st_size))
+        entries.sort()
+
+        self._index = OrderedDict()
+        self._total = 0
+        for _, match_id, path, size in entries:
+            self._index[match_id] = (path, size)
+            self._total += size
+        logger.info(f"Кеш матчей: {len(self._index)} файлов, {self._total // 1024} КБ")
+
+    def _read(self, match_id: int):
+        if self._index is None:
+            self._load_index()
+        entry = self._index.get(match_id)
+        if entry is None:
+            return None
+        path, _ = entry
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.utime(path)
+        except OSError:
+            self._forget(match_id)
+            return None
+        try:
+            match = json.loads(_decompress(blob, path))
+        except Exception as e:
+            # Битый файл - считаем промахом и удаляем
+            logger.warning(f"Поврежден кеш матча {match_id}: {e}")
+            self._forget(match_id)
+            self._remove(path)
+            return None
+        self._index.move_to_end(match_id)
+        return match
+
+    def _write(self, match_id: int, match: dict):
+        if self._index is None:
+            self._load_index()
+        path = self._path(match_id)
+        blob = _compress(json.dumps(match, separators=(',', ':')).encode('utf-8'))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, path)
+
+        self._forget(match_id)
+        self._index[match_id] = (path, len(blob))
+        self._total += len(blob)
+        self._evict()
+
+    def _forget(self, match_id: int):
+        entry = self._index.pop(match_id, None)
+        if entry:
+            self._total -= entry[1]
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            match_id, (path, size) = self._index.popitem(last=False)
+            self._total -= size
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _locked(self, func, *args):
+        with self._lock:
+            return func(*args)
+
+    async def get(self, match_id: int):
+        return await asyncio.to_thread(self._locked, self._read, match_id)
+
+    async def put(self, match_id: int, match: dict):
+        try:
+            await asyncio.to_thread(self._locked, self._write, match_id, match)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить матч {match_id}: {e}")
+
+
+# Создаем глобальный экземпляр
+match_cache = MatchCache()
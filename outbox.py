@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+# ========== ПРИОРИТЕТЫ ==========
+# Интерактивные ответы (хендлеры) всегда обгоняют массовые рассылки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+_priority = ContextVar("outbox_priority", default=PRIORITY_INTERACTIVE)
+
+# ========== ЛИМИТЫ TELEGRAM ==========
+# ~30 сообщений/сек на бота, 1/сек в личный чат, 20/мин в группу.
+# Берем с запасом, чтобы не ловить RetryAfter
+GLOBAL_RATE = 25
+BULK_RATE = 20
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+MAX_RETRIES = 3
+PRUNE_INTERVAL = 60  # как часто чистим прошедшие дедлайны чатов
+
+
+class Outbox:
+    """Очередь исходящих сообщений с лимитами и обработкой RetryAfter"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, bulk_rate=BULK_RATE):
+        self._global_interval = 1.0 / global_rate
+        self._bulk_interval = 1.0 / bulk_rate
+        self._next_global = 0.0
+        self._next_bulk = 0.0
+        self._next_chat = {}
+        # Жесткие запреты после RetryAfter: действуют для любого приоритета
+        self._blocked_until = 0.0
+        self._blocked_chat = {}
+        self._last_prune = 0.0
+        self._queue = asyncio.Queue()
+        self._worker = None
+        self._bot = None
+
+        # Метрики
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._sent_times = deque()
+
+    # ---------- Слоты ----------
+    def _chat_interval(self, chat_id):
+        # Отрицательные id - группы и каналы
+        return GROUP_CHAT_INTERVAL if chat_id < 0 else PRIVATE_CHAT_INTERVAL
+
+    async def _acquire(self, chat_id, priority):
+        """Резервирует ближайший свободный слот и ждет его"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._prune(now)
+        slot = max(now, self._next_global, self._blocked_until, self._blocked_chat.get(chat_id, 0.0))
+
+        if priority == PRIORITY_BULK:
+            slot = max(slot, self._next_bulk)
+            self._next_bulk = slot + self._bulk_interval
+
+        # В личку интерактивные ответы идут пачкой (Telegram это допускает),
+        # интервал соблюдаем только для рассылок и групп
+        if isinstance(chat_id, int) and (chat_id < 0 or priority == PRIORITY_BULK):
+            slot = max(slot, self._next_chat.get(chat_id, 0.0))
+            self._next_chat[chat_id] = slot + self._chat_interval(chat_id)
+
+        self._next_global = slot + self._global_interval
+
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _penalize(self, chat_id, retry_after, priority):
+        """После RetryAfter запрещаем отправку в чат до дедлайна"""
+        until = asyncio.get_running_loop().time() + retry_after
+        self._blocked_chat[chat_id] = max(self._blocked_chat.get(chat_id, 0.0), until)
+        if priority == PRIORITY_BULK:
+            # Рассылка уперлась в общий лимит бота: притормаживаем всех
+            self._blocked_until = max(self._blocked_until, until)
+            self._next_bulk = max(self._next_bulk, until)
+
+    def _prune(self, now):
+        """Убирает чаты, дедлайны которых уже прошли, чтобы словари не росли"""
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        for deadlines in (self._next_chat, self._blocked_chat):
+            for chat_id in [c for c, t in deadlines.items() if t <= now]:
+                del deadlines[chat_id]
+
+    def _record_sent(self):
+        self.sent += 1
+        now = time.monotonic()
+        self._sent_times.append(now)
+        while self._sent_times and now - self._sent_times[0] > 60:
+            self._sent_times.popleft()
+
+    # ---------- Middleware для bot.session ----------
+    async def middleware(self, make_request, bot, method):
+        """Пропускает каждый запрос к Bot API через лимиты"""
+        chat_id = getattr(method, "chat_id", None)
+
+        # getUpdates, answerCallbackQuery и т.п. без чата не ограничиваем
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                result = await make_request(bot, method)
+                self._record_sent()
+                return result
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                logger.warning(f"RetryAfter {e.retry_after}s для чата {chat_id}")
+                self._penalize(chat_id, e.retry_after, priority)
+
+    def setup(self, bot):
+        bot.session.middleware(self.middleware)
+        self._bot = bot
+
+    # ---------- Массовые рассылки ----------
+    def broadcast(self, chat_ids, text, **kwargs):
+        """Ставит рассылку в очередь, не блокируя хендлер"""
+        count = 0
+        for chat_id in chat_ids:
+            self._queue.put_nowait((chat_id, text, kwargs))
+            count += 1
+        logger.info(f"📨 В очередь рассылки добавлено {count} сообщений")
+        return count
+
+    async def _bulk_worker(self):
+        _priority.set(PRIORITY_BULK)
+        while True:
+            chat_id, text, kwargs = await self._queue.get()
+            try:
+                await self._bot.send_message(chat_id, text, **kwargs)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат удален
+                self.failed += 1
+                logger.info(f"Рассылка в {chat_id} пропущена: {e}")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка рассылки в {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+                if self._queue.empty():
+                    logger.info(f"📊 Очередь рассылки пуста: {self.stats()}")
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._bulk_worker())
+
+    async def stop(self):
+        """Останавливает воркер и возвращает неотправленные сообщения"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        pending = []
+        while not self._queue.empty():
+            pending.append(list(self._queue.get_nowait()))
+            self._queue.task_done()
+        return pending
+
+    def restore(self, pending):
+        for chat_id, text, kwargs in pending:
+            self._queue.put_nowait((chat_id, text, kwargs))
+        if pending:
+            logger.info(f"📨 Восстановлено {len(pending)} сообщений рассылки")
+
+    # ---------- Метрики ----------
+    def stats(self):
+        now = time.monotonic()
+        recent = sum(1 for t in self._sent_times if now - t <= 60)
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+            "per_minute": recent,
+        }
+
+
+# Создаем глобальный экземпляр
+outbox = Outbox()
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+
+class Template:
+    """Шаблон ответа: заголовок + строка на каждый элемент + подвал"""
+
+    def __init__(self, header, row, footer=""):
+        self.header = header
+        self.row = row
+        self.footer = footer
+
+    def render(self, rows, **context):
+        # join вместо += в цикле
+        return "".join((
+            self.header.format_map(context),
+            "".join(self.row.format_map(r) for r in rows),
+            self.footer.format_map(context),
+        ))
+
+
+# ========== ШАБЛОНЫ ==========
+LEADERBOARD = Template(
+    "🏆 <b>{title}:</b>\n\n",
+    "{pos}. ID {telegram_id}: {score} очков\n"
+)
+
+FRIENDS = Template(
+    "👥 <b>Ваши друзья:</b>\n\n",
+    "• {friend_name} (ID: {friend_account_id})\n"
+)
+
+PROFILE = Template(
+    "👤 <b>{name}</b>\n🎯 MMR: {mmr}\n\n<b>Последние игры:</b>\n",
+    "{outcome} {hero}: {kills}/{deaths}/{assists}\n"
+)
+
+META = Template(
+    "📈 <b>Мета среди игроков бота</b> ({total} игр):\n\n",
+    "{pos}. <b>{hero}</b>: пик {pick_rate:.1f}%, винрейт {win_rate:.1f}%, "
+    "KDA {kills:.1f}/{deaths:.1f}/{assists:.1f} ({kda:.2f})\n"
+)
+
+
+class RenderCache:
+    """Готовые строки ответов, ключ - версия данных"""
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._versions = {}
+        self._data = OrderedDict()
+
+    def bump(self, name):
+        """Данные изменились: старые рендеры больше не используются"""
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get_or_render(self, name, key, render):
+        cache_key = (name, key, self._versions.get(name, 0))
+        text = self._data.get(cache_key)
+        if text is not None:
+            self._data.move_to_end(cache_key)
+            return text
+
+        text = render()
+        # Пустой результат (нет данных) не кешируем
+        if text is not None:
+            self._data[cache_key] = text
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return text
+
+
+# Создаем глобальный экземпляр
+render_cache = RenderCache()
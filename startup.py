@@ -0,0 +1,42 @@
+import time
+import logging
+import threading
+
+# Подробнее по импортам: python -X importtime main.py
+logger = logging.getLogger(__name__)
+
+_t0 = time.perf_counter()
+_phases = []
+
+# Выставляется, когда БД, константы и HTTP-пул прогреты
+ready = threading.Event()
+
+
+class phase:
+    """Замеряет длительность этапа запуска: with startup.phase("имя"): ..."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _phases.append((self.name, time.perf_counter() - self.start))
+        return False
+
+
+async def timed(name, awaitable):
+    with phase(name):
+        return await awaitable
+
+
+def uptime():
+    return time.perf_counter() - _t0
+
+
+def mark_ready():
+    ready.set()
+    lines = "\n".join(f"  {name}: {duration * 1000:.0f} мс" for name, duration in _phases)
+    logger.info(f"⏱ Профиль запуска (всего {uptime() * 1000:.0f} мс):\n{lines}")
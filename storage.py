@@ -77,6 +77,33 @@ class Database:
                 )
             ''')
         
+        # Матчи пользователей и агрегат по героям (одинаково для обеих БД)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_matches (
+                account_id BIGINT NOT NULL,
+                match_id BIGINT NOT NULL,
+                hero_id INTEGER NOT NULL,
+                win BOOLEAN NOT NULL,
+                kills INTEGER DEFAULT 0,
+                deaths INTEGER DEFAULT 0,
+                assists INTEGER DEFAULT 0,
+                PRIMARY KEY (account_id, match_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS hero_stats (
+                hero_id INTEGER PRIMARY KEY,
+                picks INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                kills INTEGER DEFAULT 0,
+                deaths INTEGER DEFAULT 0,
+                assists INTEGER DEFAULT 0
+            )
+        ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_hero_stats_picks ON hero_stats (picks DESC)')
+        
         conn.commit()
         conn.close()
         logger.info("✅ База данных инициализирована")
@@ -223,6 +250,103 @@ class Database:
                     'score': row[1]
                 })
         return result
+    
+    def get_all_user_ids(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT telegram_id FROM users')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [row['telegram_id'] if self.use_postgres else row[0] for row in rows]
+
+    def get_all_account_ids(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT account_id FROM users')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [row['account_id'] if self.use_postgres else row[0] for row in rows]
+    
+    def record_matches(self, account_id, matches):
+        """Сохраняет матчи и добавляет в hero_stats только новые"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if self.use_postgres:
+            insert_match = '''
+                INSERT INTO user_matches (account_id, match_id, hero_id, win, kills, deaths, assists)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT DO NOTHING
+            '''
+            upsert_stats = '''
+                INSERT INTO hero_stats (hero_id, picks, wins, kills, deaths, assists)
+                VALUES (%s, 1, %s, %s, %s, %s)
+                ON CONFLICT (hero_id) DO UPDATE SET
+                    picks = hero_stats.picks + 1,
+                    wins = hero_stats.wins + EXCLUDED.wins,
+                    kills = hero_stats.kills + EXCLUDED.kills,
+                    deaths = hero_stats.deaths + EXCLUDED.deaths,
+                    assists = hero_stats.assists + EXCLUDED.assists
+            '''
+        else:
+            insert_match = '''
+                INSERT OR IGNORE INTO user_matches (account_id, match_id, hero_id, win, kills, deaths, assists)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            '''
+            upsert_stats = '''
+                INSERT INTO hero_stats (hero_id, picks, wins, kills, deaths, assists)
+                VALUES (?, 1, ?, ?, ?, ?)
+                ON CONFLICT (hero_id) DO UPDATE SET
+                    picks = picks + 1,
+                    wins = wins + excluded.wins,
+                    kills = kills + excluded.kills,
+                    deaths = deaths + excluded.deaths,
+                    assists = assists + excluded.assists
+            '''
+        
+        added = 0
+        for m in matches:
+            win = (m.get('player_slot', 0) < 128) == bool(m.get('radiant_win'))
+            k, d, a = m.get('kills', 0), m.get('deaths', 0), m.get('assists', 0)
+            cursor.execute(insert_match, (account_id, m['match_id'], m['hero_id'], win, k, d, a))
+            # rowcount == 0 - матч уже учтен
+            if cursor.rowcount == 1:
+                cursor.execute(upsert_stats, (m['hero_id'], int(win), k, d, a))
+                added += 1
+        
+        conn.commit()
+        conn.close()
+        return added
+    
+    def get_hero_meta(self, limit=10):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT COALESCE(SUM(picks), 0) AS total FROM hero_stats')
+        row = cursor.fetchone()
+        total = row['total'] if self.use_postgres else row[0]
+        
+        if self.use_postgres:
+            cursor.execute('''
+                SELECT hero_id, picks, wins, kills, deaths, assists
+                FROM hero_stats
+                ORDER BY picks DESC
+                LIMIT %s
+            ''', (limit,))
+        else:
+            cursor.execute('''
+                SELECT hero_id, picks, wins, kills, deaths, assists
+                FROM hero_stats
+                ORDER BY picks DESC
+                LIMIT ?
+            ''', (limit,))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return total, [dict(row) for row in rows]
 
 # Создаем глобальный экземпляр
 db = Database()
@@ -247,4 +371,16 @@ def update_score(telegram_id, points):
     return db.update_score(telegram_id, points)
 
 def get_leaderboard(limit=10):
-    return db.get_leaderboard(limit)
\ No newline at end of file
+    return db.get_leaderboard(limit)
+
+def get_all_user_ids():
+    return db.get_all_user_ids()
+
+def get_all_account_ids():
+    return db.get_all_account_ids()
+
+def record_matches(account_id, matches):
+    return db.record_matches(account_id, matches)
+
+def get_hero_meta(limit=10):
+    return db.get_hero_meta(limit)